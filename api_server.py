@@ -1,20 +1,25 @@
 import asyncio
+import logging
 import time
 from typing import List
 import json
 
-import cv2
-from fastapi import FastAPI, BackgroundTasks
+from fastapi import FastAPI, BackgroundTasks, APIRouter, Depends, HTTPException
 from fastapi.responses import StreamingResponse
 from starlette.middleware.cors import CORSMiddleware
 
 from lotpose.frame_collector import FrameCollector
-from app_manager import AppManager, AppState
-from models import MsgResponse
+from lotpose.preview_hub import PreviewTierName
+from lotpose.tracing import tracer
+from app_manager import AppManager, AppState, IAppManager, DEFAULT_RIG_ID
+from models import MsgResponse, HealthResponse, CreateRigRequest
+from rig_manager import RigManager, RigInfo
 from utils import cv_utils
 from lotpose.webcam_manager import WebcamManager
 from utils.cv_utils import WebcamDeviceInfo
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
 
 origins = ["*"]
@@ -28,80 +33,163 @@ app.add_middleware(
 )
 
 
-@app.get("/", response_model=None)
-async def app_state():
-    return AppManager.Singleton.get_app_state_dto()
+def get_rig(rig_id: str = DEFAULT_RIG_ID) -> IAppManager:
+    """resolve the rig a request addresses"""
+    rig = RigManager.Singleton.get_rig(rig_id)
+    if rig is None:
+        raise HTTPException(status_code=404, detail=f"Rig {rig_id} not found")
+    return rig
+
+
+def start_warmup(rig: IAppManager) -> None:
+    """warm up a rig in a worker thread so the server keeps accepting requests, failures are logged"""
+    def log_error(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("warmup of rig %s failed", rig.rig_id, exc_info=future.exception())
+
+    future = asyncio.get_running_loop().run_in_executor(None, rig.warmup)
+    future.add_done_callback(log_error)
+
+
+@app.get("/health", response_model=HealthResponse)
+async def health():
+    state = AppManager.Singleton.get_app_state_dto()
+    return HealthResponse(status="ok" if state.warmup_error is None else "error", is_warmed_up=state.is_warmed_up,
+                          warmup_error=state.warmup_error)
 
 
 @app.get("/list-webcams", response_model=List[WebcamDeviceInfo])
 async def list_webcams():
-    return AppManager.Singleton.get_app_state_dto().webcams_info
+    # probing webcams blocks, run it off the event loop (no-op once warmup has probed them)
+    return await asyncio.to_thread(AppManager.Singleton.get_webcams_info)
+
+
+@app.get("/rigs", response_model=List[RigInfo])
+async def list_rigs():
+    return RigManager.Singleton.list_rigs()
+
+
+@app.post("/rigs", response_model=MsgResponse)
+async def create_rig(request: CreateRigRequest):
+    if RigManager.Singleton.get_rig(request.rig_id) is not None:
+        raise HTTPException(status_code=409, detail=f"Rig {request.rig_id} already exists")
+
+    rig = RigManager.Singleton.create_rig(request.rig_id)
+
+    # cached after the startup warmup, only fills in the rig's state
+    start_warmup(rig)
+
+    return MsgResponse(msg=f"Rig {request.rig_id} created")
+
+
+@app.get("/rigs/{rig_id}", response_model=None)
+async def rig_state(rig: IAppManager = Depends(get_rig)):
+    # the rig router serves the state at /rigs/{rig_id}/, a route can't have an empty path under a prefix
+    return rig.get_app_state_dto()
+
+
+@app.delete("/rigs/{rig_id}", response_model=MsgResponse)
+async def remove_rig(background_tasks: BackgroundTasks, rig: IAppManager = Depends(get_rig)):
+    if rig.rig_id == DEFAULT_RIG_ID:
+        raise HTTPException(status_code=400, detail="The default rig can't be removed")
+    # its webcams would open after the rig is gone, and nothing could stop them
+    if rig.get_app_state_dto().webcam_starting:
+        raise HTTPException(status_code=409, detail=f"Rig {rig.rig_id} is starting, retry once it has started")
+
+    await RigManager.Singleton.remove_rig(rig.rig_id)
+
+    # the other rigs share the freed inference workers
+    background_tasks.add_task(RigManager.Singleton.reselect_pose_models)
+
+    return MsgResponse(msg=f"Rig {rig.rig_id} removed")
+
+
+# routes of a single rig, served under /rigs/{rig_id} and un-prefixed for the default rig
+rig_router = APIRouter()
+
 
+@rig_router.get("/", response_model=None)
+async def app_state(rig: IAppManager = Depends(get_rig)):
+    return rig.get_app_state_dto()
 
-@app.post("/start-webcams", response_model=MsgResponse)
-async def start_webcams(device_indices: List[int], background_tasks: BackgroundTasks):
+
+@rig_router.post("/start-webcams", response_model=MsgResponse)
+async def start_webcams(device_indices: List[int], background_tasks: BackgroundTasks,
+                        rig: IAppManager = Depends(get_rig)):
     # start app
-    AppManager.Singleton.start_webcams(device_indices)
+    RigManager.Singleton.assert_devices_available(rig.rig_id, device_indices)
+    await rig.start_webcams(device_indices, RigManager.Singleton.count_cameras(exclude_rig_id=rig.rig_id))
 
-    background_tasks.add_task(AppManager.Singleton.start_pipeline_bg_task)
+    # the other rigs now share the inference workers with more cameras, the new load is already benchmarked
+    background_tasks.add_task(RigManager.Singleton.reselect_pose_models)
+    background_tasks.add_task(rig.start_pipeline_bg_task)
 
     return MsgResponse(msg="Webcams started")
 
 
-@app.post("/calibrate-camera", response_model=MsgResponse)
-async def calibrate_camera(background_tasks: BackgroundTasks):
-    assert AppManager.Singleton.get_app_state_dto().webcam_stared, "Webcams not started"
+@rig_router.post("/calibrate-camera", response_model=MsgResponse)
+async def calibrate_camera(background_tasks: BackgroundTasks, rig: IAppManager = Depends(get_rig)):
+    assert rig.get_app_state_dto().webcam_stared, "Webcams not started"
 
-    background_tasks.add_task(AppManager.Singleton.start_calibration_bg_task)
+    background_tasks.add_task(rig.start_calibration_bg_task)
 
     return MsgResponse(msg="Calibration started")
 
 
-@app.post("/stop-webcams", response_model=MsgResponse)
-async def stop_webcams():
+@rig_router.post("/stop-webcams", response_model=MsgResponse)
+async def stop_webcams(background_tasks: BackgroundTasks, rig: IAppManager = Depends(get_rig)):
     # stop app
-    AppManager.Singleton.stop_webcams_n_pipeline()
-
-    return MsgResponse(msg="Webcams stopped")
+    await rig.stop_webcams_n_pipeline()
 
+    # the other rigs share the freed inference workers
+    background_tasks.add_task(RigManager.Singleton.reselect_pose_models)
 
-@app.get("/get-stream/{device_index}")
-async def get_stream(device_index: int):
-    # Define a generator function to retrieve video frames
-    async def generate_frames():
-        while True:
-            if not AppManager.Singleton.get_app_state_dto().webcam_stared:
-                break
-
-            # Read the next frame from the video capture
-            frames = AppManager.Singleton.get_webcams_frames()[device_index].value
-            mono_results = AppManager.Singleton.get_mono_results()
-            try:
-                annotated_img = mono_results[device_index].annotated_img
-            except KeyError:
-                await asyncio.sleep(0.032)
-                continue
+    return MsgResponse(msg="Webcams stopped")
 
-            # Convert the frame to JPEG format
-            _, jpeg = cv2.imencode('.jpg', annotated_img)
-            frame_bytes = jpeg.tobytes()
 
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+@rig_router.get("/get-stream/{device_index}")
+async def get_stream(device_index: int, tier: PreviewTierName = PreviewTierName.high,
+                     rig: IAppManager = Depends(get_rig)):
+    """stream annotated frames of a device, `tier` selects the preview resolution and jpeg quality"""
+    # an outbox of a camera that isn't running would never get a frame
+    if device_index not in rig.get_app_state_dto().stared_device_indices:
+        raise HTTPException(status_code=404, detail=f"Webcam {device_index} not started")
 
-            await asyncio.sleep(0.048)
+    async def generate_frames():
+        if not rig.get_app_state_dto().webcam_stared:
+            return
+
+        # each connection gets its own latest-frame-only outbox, slow clients drop frames instead of queueing them
+        outbox = rig.subscribe_preview(device_index, tier)
+        try:
+            while True:
+                preview_frame = await outbox.get()
+                if preview_frame is None:
+                    break
+
+                # X-Timestamp is the capture time (ms) of the frame, lets clients measure latency
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n'
+                       b'X-Timestamp: ' + str(preview_frame.timestamp).encode() + b'\r\n\r\n'
+                       + preview_frame.jpeg + b'\r\n')
+        finally:
+            rig.unsubscribe_preview(device_index, tier, outbox)
 
     return StreamingResponse(generate_frames(), media_type='multipart/x-mixed-replace; boundary=frame')
 
 
-@app.get("/stream-3d")
-async def stream_3d():
+@rig_router.get("/stream-3d")
+async def stream_3d(rig: IAppManager = Depends(get_rig)):
     async def generate_3d_landmark():
         while True:
-            if not AppManager.Singleton.get_app_state_dto().webcam_stared:
+            if not rig.get_app_state_dto().webcam_stared:
                 break
 
-            landmark_3d = AppManager.Singleton.get_landmark_3d()
+            landmark_3d = rig.get_landmark_3d()
+            if landmark_3d is None:
+                # no pose detected yet
+                await asyncio.sleep(0.048)
+                continue
 
             json_data = json.dumps({"timestamp": landmark_3d.timestamp, "value": landmark_3d.value.tolist()})
             yield json.dumps(json_data) + "\n"
@@ -111,8 +199,36 @@ async def stream_3d():
     return StreamingResponse(generate_3d_landmark(), media_type="application/json")
 
 
+app.include_router(rig_router)
+app.include_router(rig_router, prefix="/rigs/{rig_id}")
+
+
+@app.post("/trace/start", response_model=MsgResponse)
+async def start_trace():
+    tracer.clear()
+    tracer.enable()
+    return MsgResponse(msg="Tracing started")
+
+
+@app.post("/trace/stop", response_model=MsgResponse)
+async def stop_trace():
+    tracer.disable()
+    return MsgResponse(msg="Tracing stopped")
+
+
+@app.get("/trace")
+async def get_trace():
+    """recorded spans as Chrome trace JSON, open in chrome://tracing or https://ui.perfetto.dev"""
+    return tracer.to_chrome_trace()
+
+
+@app.on_event("startup")
+async def startup_event():
+    # warm up in a worker thread so the server accepts requests right away
+    start_warmup(AppManager.Singleton)
+
+
 @app.on_event("shutdown")
 async def shutdown_event():
-    if AppManager.Singleton.get_app_state_dto().webcam_stared:
-        AppManager.Singleton.stop_webcams_n_pipeline()
+    await RigManager.Singleton.stop_all()
     print("shutdown_event")
@@ -9,9 +9,16 @@ import numpy as np
 from lotpose.dtos.landmark_3d_dto import Landmark3dDto
 from lotpose.dtos.mono_result_dto import MonoResultDto
 from lotpose.frame_collector import FrameCollector
+from lotpose.inference_scheduler import get_inference_scheduler
 from lotpose.dtos.frame_dto import FrameDto
+from lotpose import monocam_pose_landmarker
 from lotpose.monocam_pose_landmarker import MonoCamPoseLandmarker
+from lotpose.motion_gate import MotionGate
+from lotpose.pose_model_selector import get_pose_model_selector
+from lotpose.preview_hub import PreviewHub, PreviewTierName, LatestFrameOutbox
 from lotpose.three_landmarker import ThreeLandmarker
+from lotpose.tracing import tracer
+from lotpose.webcam_controller import WebcamController
 from lotpose.webcam_manager import WebcamManager
 from utils import cv_utils
 
@@ -19,12 +26,22 @@ from utils import cv_utils
 frame_collector_tolerant_interval = 30
 request_width = 640
 request_height = 480
+motion_gate_pixel_threshold = 25  # abs difference [0, 255] of a grayscale thumbnail pixel that counts as changed
+motion_gate_changed_fraction = 0.02  # fraction of changed thumbnail pixels that is motion, None disables the gate
+motion_gate_refresh_interval = 1000  # (ms) re-run inference at least this often on static cameras
+pose_model_frame_budget = 33  # (ms) inference time for one batch of every rig, picks the pose model variant
+webcam_controller_factory = WebcamController  # replaced by the load test to run on synthetic frame sources
+inference_workers = None  # worker threads shared by the inference of all rigs, None uses the cpu count
+
+DEFAULT_RIG_ID = "default"
 
 
 @dataclass
 class AppState:
     """State of the app"""
+    rig_id: str = DEFAULT_RIG_ID
     webcam_stared: bool = False
+    webcam_starting: bool = False  # the webcams are being opened and the pose models loaded
     stared_device_indices: List[int] = None
     webcams_info: List[cv_utils.WebcamDeviceInfo] = None
     current_frames: dict[int, FrameDto] = field(default=None, repr=False)
@@ -33,25 +50,49 @@ class AppState:
     is_camera_calibrated: bool = False
     is_camera_calibrating: bool = False
     calibrate_progress: float = 0.0
+    is_warmed_up: bool = False
+    warmup_error: Optional[str] = None
+    motion_gate_hit_rate: float = 0.0
+    preview_dropped_frames: int = 0  # frames the preview streams dropped for slow clients
+    pose_model_variant: Optional[str] = None
+    pose_model_latencies: dict[str, float] = None  # (ms) benchmarked latency of each variant
 
 
 @dataclass
 class AppStateDto:
+    rig_id: str = DEFAULT_RIG_ID
     webcam_stared: bool = False
+    webcam_starting: bool = False  # the webcams are being opened and the pose models loaded
     stared_device_indices: List[int] = None
     webcams_info: List[cv_utils.WebcamDeviceInfo] = None
     is_camera_calibrated: bool = False
     is_camera_calibrating: bool = False
     calibrate_progress: float = 0.0
+    is_warmed_up: bool = False
+    warmup_error: Optional[str] = None
+    motion_gate_hit_rate: float = 0.0
+    preview_dropped_frames: int = 0  # frames the preview streams dropped for slow clients
+    pose_model_variant: Optional[str] = None
+    pose_model_latencies: dict[str, float] = None  # (ms) benchmarked latency of each variant
 
 
 class IAppManager(Protocol):
+    rig_id: str
     _app_state: AppState
 
     def get_app_state_dto(self) -> AppStateDto:
         ...
 
-    def start_webcams(self, device_indices: List[int]) -> None:
+    def warmup(self) -> None:
+        ...
+
+    def get_webcams_info(self) -> List[cv_utils.WebcamDeviceInfo]:
+        ...
+
+    async def start_webcams(self, device_indices: List[int], shared_cameras: int = 0) -> None:
+        ...
+
+    async def reselect_pose_model(self, num_cameras: int) -> None:
         ...
 
     async def start_calibration_bg_task(self) -> None:
@@ -69,57 +110,161 @@ class IAppManager(Protocol):
     def get_landmark_3d(self) -> Landmark3dDto:
         ...
 
-    def stop_webcams_n_pipeline(self) -> None:
+    def subscribe_preview(self, device_index: int, tier_name: PreviewTierName) -> LatestFrameOutbox:
+        ...
+
+    def unsubscribe_preview(self, device_index: int, tier_name: PreviewTierName, outbox: LatestFrameOutbox) -> None:
+        ...
+
+    async def stop_webcams_n_pipeline(self) -> None:
         ...
 
 
 class AppManager(IAppManager):
-    """Singleton class for managing the app"""
+    """Manages one camera rig (webcams, pipeline, calibration and state), `Singleton` is the default rig"""
     Singleton: IAppManager = None
+    rig_id: str
     _app_state: AppState
     webcam_manager: Optional[WebcamManager] = None
     mono_landmarker: MonoCamPoseLandmarker = None
     three_landmarker: ThreeLandmarker = None
+    preview_hub: PreviewHub = None
     pipe_task: asyncio.Task = None
 
-    def __init__(self):
-        self._app_state = AppState()
-        self._app_state.webcams_info = cv_utils.list_webcams()
+    def __init__(self, rig_id: str = DEFAULT_RIG_ID):
+        """
+        :param rig_id: id the rig is addressed by through the api
+        """
+        # keep construction cheap, webcams are probed and mediapipe is loaded in `warmup` or on first use
+        self.rig_id = rig_id
+        self._app_state = AppState(rig_id=rig_id)
         self._app_state.stared_device_indices = []
+        self.preview_hub = PreviewHub()
 
     def get_app_state_dto(self) -> AppStateDto:
         dto = AppStateDto(
+            rig_id=self._app_state.rig_id,
             webcam_stared=self._app_state.webcam_stared,
+            webcam_starting=self._app_state.webcam_starting,
             stared_device_indices=self._app_state.stared_device_indices,
             webcams_info=self._app_state.webcams_info,
             is_camera_calibrated=self._app_state.is_camera_calibrated,
             is_camera_calibrating=self._app_state.is_camera_calibrating,
-            calibrate_progress=self._app_state.calibrate_progress
+            calibrate_progress=self._app_state.calibrate_progress,
+            is_warmed_up=self._app_state.is_warmed_up,
+            warmup_error=self._app_state.warmup_error,
+            motion_gate_hit_rate=self._app_state.motion_gate_hit_rate,
+            preview_dropped_frames=self._app_state.preview_dropped_frames,
+            pose_model_variant=self._app_state.pose_model_variant,
+            pose_model_latencies=self._app_state.pose_model_latencies
         )
         return dto
 
-    def start_webcams(self, device_indices: List[int]) -> None:
-        """init and start webcams"""
+    def warmup(self) -> None:
+        """probe webcams and load mediapipe, blocking, meant to be run in a worker thread after startup"""
+        try:
+            self.get_webcams_info()
+            monocam_pose_landmarker.preload()
+            self._benchmark_pose_models()
+        except Exception as e:
+            # keep the failure visible in the state, the caller doesn't wait for the result
+            self._app_state.warmup_error = repr(e)
+            raise
+        self._app_state.warmup_error = None
+        self._app_state.is_warmed_up = True
+
+    def get_webcams_info(self) -> List[cv_utils.WebcamDeviceInfo]:
+        """get available webcams, probe them on first call"""
+        if self._app_state.webcams_info is None:
+            self._app_state.webcams_info = cv_utils.get_webcams_info()
+
+        return self._app_state.webcams_info
+
+    def _benchmark_pose_models(self) -> None:
+        """benchmark the pose model variants, runs once per process"""
+        benchmarks = get_pose_model_selector(pose_model_frame_budget).benchmark()
+        self._app_state.pose_model_latencies = {k: b.latency for k, b in benchmarks.items()}
+
+    async def start_webcams(self, device_indices: List[int], shared_cameras: int = 0) -> None:
+        """
+        init and start webcams, the blocking parts run in a worker thread to keep the other rigs streaming
+
+        :param shared_cameras: cameras of other rigs running on the same inference workers, picks the pose model
+        """
+
+        assert self.webcam_manager is None and not self._app_state.webcam_starting, "Webcams already started"
+
+        # reserve the devices while the webcams open, so no other rig can start them
+        self._app_state.webcam_starting = True
+        self._app_state.stared_device_indices = device_indices
+        try:
+            self.webcam_manager, self.mono_landmarker = await asyncio.to_thread(self._create_pipeline,
+                                                                                device_indices, shared_cameras)
+        except BaseException:
+            self._app_state.stared_device_indices = []
+            raise
+        finally:
+            self._app_state.webcam_starting = False
+
+        self.three_landmarker = ThreeLandmarker()
+        self._app_state.webcam_stared = True
 
-        assert self.webcam_manager is None, "Webcams already started"
+    def _create_pipeline(self, device_indices: List[int],
+                         shared_cameras: int) -> tuple[WebcamManager, MonoCamPoseLandmarker]:
+        """open the webcams and load the pose models, blocking"""
 
         # init
         frame_collector = FrameCollector(tolerant_interval=frame_collector_tolerant_interval)
-        self.webcam_manager = WebcamManager(device_indices, frame_collector, request_width, request_height)
+        webcam_manager = WebcamManager(device_indices, frame_collector, request_width, request_height,
+                                       webcam_controller_factory)
 
-        self.mono_landmarker = MonoCamPoseLandmarker(device_indices)
-        self.three_landmarker = ThreeLandmarker()
+        motion_gate = None
+        if motion_gate_changed_fraction is not None:
+            motion_gate = MotionGate(motion_gate_pixel_threshold, motion_gate_changed_fraction,
+                                     motion_gate_refresh_interval)
+
+        # re-evaluate the model variant for the new number of cameras on the shared inference workers
+        self._app_state.pose_model_variant = self._select_pose_model(len(device_indices) + shared_cameras)
+        mono_landmarker = MonoCamPoseLandmarker(
+            device_indices, motion_gate,
+            get_pose_model_selector(pose_model_frame_budget).model_variants[self._app_state.pose_model_variant],
+            get_inference_scheduler(inference_workers), self.rig_id)
 
         # start webcams
-        self.webcam_manager.start_all()
-        self._app_state.webcam_stared = True
-        self._app_state.stared_device_indices = device_indices
+        webcam_manager.start_all()
+
+        return webcam_manager, mono_landmarker
+
+    def _select_pose_model(self, num_cameras: int) -> str:
+        """pick the pose model variant for the cameras of every rig, blocking, may benchmark the new load"""
+        self._benchmark_pose_models()
+        return get_pose_model_selector(pose_model_frame_budget).select(
+            num_cameras, get_inference_scheduler(inference_workers).num_workers)
+
+    async def reselect_pose_model(self, num_cameras: int) -> None:
+        """
+        pick the pose model again after cameras were added or removed on the shared inference workers, the
+        landmarkers are switched between two batches
+
+        :param num_cameras: cameras of every rig, including this one
+        """
+        if self.webcam_manager is None:
+            return
+
+        variant = await asyncio.to_thread(self._select_pose_model, num_cameras)
+        # stopped in the meantime
+        if self.webcam_manager is None:
+            return
+
+        self._app_state.pose_model_variant = variant
+        self.mono_landmarker.switch_model(get_pose_model_selector(pose_model_frame_budget).model_variants[variant])
 
     async def start_pipeline_bg_task(self) -> None:
         """start process of input image and output prediction"""
         old_frames: Optional[dict[int, FrameDto]] = None
         while self.webcam_manager is not None:
-            frames = self.webcam_manager.get_frames()
+            # reading webcams blocks, keep the event loop free for the other rigs and the streams
+            frames = await asyncio.to_thread(self.webcam_manager.get_frames)
             # skip if no new frames
             if old_frames is not None and min(f.timestamp for f in frames.values()) == min(
                     f.timestamp for f in old_frames.values()):
@@ -128,7 +273,8 @@ class AppManager(IAppManager):
             old_frames = frames
 
             # mono camera pose estimation pass
-            mono_results = await self.mono_landmarker.process_async(frames)
+            with tracer.span("pipeline.mono_landmarker", min(f.frame_id for f in frames.values())):
+                mono_results = await self.mono_landmarker.process_async(frames)
 
             #
             landmarks_3d = self.three_landmarker.process(mono_results)
@@ -136,9 +282,15 @@ class AppManager(IAppManager):
             # set state
             self._app_state.current_frames = frames
             self._app_state.current_mono_results = mono_results
+            if self.mono_landmarker.motion_gate is not None:
+                self._app_state.motion_gate_hit_rate = self.mono_landmarker.motion_gate.hit_rate
             if landmarks_3d is not None:
                 self._app_state.current_3d_results = landmarks_3d
 
+            # push annotated previews to the stream clients
+            await self.preview_hub.publish(mono_results)
+            self._app_state.preview_dropped_frames = self.preview_hub.dropped
+
             await asyncio.sleep(0.048)  # run 60 fps
 
     async def start_calibration_bg_task(self) -> None:
@@ -182,7 +334,7 @@ class AppManager(IAppManager):
                 break
 
             # get frames
-            frames = self.webcam_manager.get_frames()
+            frames = await asyncio.to_thread(self.webcam_manager.get_frames)
             gray_frames = {k: cv2.cvtColor(f.value, cv2.COLOR_BGR2GRAY) for k, f in frames.items()}
 
             # find the chessboard corners (rect, corners)
@@ -245,16 +397,31 @@ class AppManager(IAppManager):
     def get_landmark_3d(self) -> Landmark3dDto:
         return self._app_state.current_3d_results
 
-    def stop_webcams_n_pipeline(self) -> None:
+    def subscribe_preview(self, device_index: int, tier_name: PreviewTierName) -> LatestFrameOutbox:
+        """get a latest-frame-only outbox of the annotated preview of a device"""
+        return self.preview_hub.subscribe(device_index, tier_name)
+
+    def unsubscribe_preview(self, device_index: int, tier_name: PreviewTierName, outbox: LatestFrameOutbox) -> None:
+        """release the outbox of a closed stream"""
+        self.preview_hub.unsubscribe(device_index, tier_name, outbox)
+
+    async def stop_webcams_n_pipeline(self) -> None:
         """stop all webcams"""
-        self.webcam_manager.stop_all()
+        assert self.webcam_manager is not None, "Webcams not started"
+        webcam_manager = self.webcam_manager
         self.webcam_manager = None
         self._app_state.webcam_stared = False
         self._app_state.stared_device_indices = []
 
+        # end preview streams
+        self.preview_hub.close()
+
         # stop pipeline
         if self.pipe_task is not None:
             self.pipe_task.cancel()
 
+        # releasing the webcams waits for an in-flight frame read, keep it off the event loop
+        await asyncio.to_thread(webcam_manager.stop_all)
+
 
 AppManager.Singleton = AppManager()
@@ -0,0 +1,289 @@
+"""
+Load test of api_server without webcams.
+
+Starts the server in a child process on synthetic or video file frame sources, then ramps up the number of
+concurrent `/get-stream` and `/stream-3d` clients and reports delivered frame rate, latency and server CPU/memory.
+Clients are judged against what a single client receives, the rate the pipeline actually publishes.
+
+    python load_test.py --cameras 2 --source dance.mp4 --ramp 1 2 4 8 16
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import statistics
+import time
+from dataclasses import dataclass, field
+from functools import partial
+from typing import List, Optional
+
+import psutil
+
+
+@dataclass
+class ClientStats:
+    """what a single streaming client received during the measurement window, repeated frames aren't counted"""
+    path: str
+    frames: int = 0  # number of distinct frames (capture timestamps) received
+    latencies: List[float] = field(default_factory=list)  # (ms) receive time - capture time
+    last_timestamp: Optional[int] = None  # capture time of the last counted frame, kept across resets
+
+    def reset(self):
+        self.frames = 0
+        self.latencies = []
+
+
+@dataclass
+class StepReport:
+    """result of one ramp step"""
+    num_clients: int
+    video_fps: List[float]  # distinct frames per second delivered to each /get-stream client
+    video_latencies: List[float]  # (ms)
+    landmark_fps: List[float]  # distinct landmarks per second delivered to each /stream-3d client
+    landmark_latencies: List[float]  # (ms)
+    server_cpu: float  # (%) of one core
+    server_rss: float  # (MB)
+
+
+def run_server(host: str, port: int, source: str, fps: float):
+    """entry of the server process, swaps the webcams for synthetic frame sources and runs uvicorn"""
+    import uvicorn
+
+    import app_manager
+    from api_server import app
+    from lotpose.synthetic_frame_source import SyntheticFrameSource, VideoFileFrameSource
+
+    if source == "synthetic":
+        app_manager.webcam_controller_factory = partial(SyntheticFrameSource, fps=fps)
+    else:
+        app_manager.webcam_controller_factory = partial(VideoFileFrameSource, video_path=source)
+
+    uvicorn.run(app, host=host, port=port, log_level="warning")
+
+
+async def http_request(host: str, port: int, method: str, path: str, body: Optional[bytes] = None) -> bytes:
+    """minimal HTTP/1.1 request, returns the response body"""
+    reader, writer = await asyncio.open_connection(host, port)
+    headers = f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n"
+    if body is not None:
+        headers += f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+    writer.write(headers.encode() + b"\r\n" + (body or b""))
+    await writer.drain()
+
+    response = await reader.read()
+    writer.close()
+
+    head, _, content = response.partition(b"\r\n\r\n")
+    if b" 200 " not in head.split(b"\r\n")[0]:
+        raise RuntimeError(f"{method} {path} failed: {head.decode(errors='replace')}")
+    return content
+
+
+async def iter_chunks(reader: asyncio.StreamReader):
+    """decode a chunked transfer encoded body"""
+    while True:
+        size = int((await reader.readline()).strip(), 16)
+        if size == 0:
+            return
+        chunk = await reader.readexactly(size)
+        await reader.readexactly(2)  # trailing \r\n
+        yield chunk
+
+
+async def stream_client(host: str, port: int, stats: ClientStats):
+    """read a streaming endpoint and record each delivered frame"""
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"GET {stats.path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+    await writer.drain()
+    await reader.readuntil(b"\r\n\r\n")
+
+    buffer = b""
+    separator = b"--frame\r\n" if stats.path.startswith("/get-stream") else b"\n"
+    try:
+        async for chunk in iter_chunks(reader):
+            buffer += chunk
+            *messages, buffer = buffer.split(separator)
+            for message in messages:
+                timestamp = _parse_timestamp(message)
+                # /stream-3d re-sends the latest landmark until a new one is produced
+                if timestamp is None or (stats.last_timestamp is not None and timestamp <= stats.last_timestamp):
+                    continue
+                stats.last_timestamp = timestamp
+                stats.frames += 1
+                stats.latencies.append(time.time() * 1000 - timestamp)
+    finally:
+        writer.close()
+
+
+def _parse_timestamp(message: bytes) -> Optional[int]:
+    """capture timestamp of a multipart jpeg part or a 3d landmark line"""
+    if message.startswith(b"Content-Type"):
+        head, _, _ = message.partition(b"\r\n\r\n")
+        for line in head.split(b"\r\n"):
+            if line.startswith(b"X-Timestamp:"):
+                return int(line.split(b":")[1])
+        return None
+
+    if message.strip() == b"":
+        return None
+    data = json.loads(message)
+    # /stream-3d sends json encoded as a json string
+    if isinstance(data, str):
+        data = json.loads(data)
+    return data["timestamp"]
+
+
+async def run_step(host: str, port: int, num_clients: int, num_cameras: int, tier: str,
+                   server: psutil.Process, warmup: float, duration: float, streaming_only: bool) -> StepReport:
+    """
+    run `num_clients` video clients and `num_clients` landmark clients and measure them
+
+    :param streaming_only: the source has no person, so no landmark clients are started
+    """
+    video_stats = [ClientStats(f"/get-stream/{i % num_cameras}?tier={tier}") for i in range(num_clients)]
+    landmark_stats = [] if streaming_only else [ClientStats("/stream-3d") for _ in range(num_clients)]
+    tasks = [asyncio.create_task(stream_client(host, port, s)) for s in video_stats + landmark_stats]
+
+    await asyncio.sleep(warmup)
+    for s in video_stats + landmark_stats:
+        s.reset()
+    server.cpu_percent(None)
+
+    await asyncio.sleep(duration)
+    server_cpu = server.cpu_percent(None)
+    server_rss = server.memory_info().rss / 2 ** 20
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    return StepReport(
+        num_clients=num_clients,
+        video_fps=[s.frames / duration for s in video_stats],
+        video_latencies=[latency for s in video_stats for latency in s.latencies],
+        landmark_fps=[s.frames / duration for s in landmark_stats],
+        landmark_latencies=[latency for s in landmark_stats for latency in s.latencies],
+        server_cpu=server_cpu,
+        server_rss=server_rss,
+    )
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if len(values) == 0:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _format_landmark_columns(r: StepReport) -> str:
+    if len(r.landmark_fps) == 0:
+        return f"{'n/a':>15} {'n/a':>16}"
+    return (f"{min(r.landmark_fps):>6.1f} /{statistics.median(r.landmark_fps):>7.1f} "
+            f"{_percentile(r.landmark_latencies, 0.5):>7.0f} /{_percentile(r.landmark_latencies, 0.95):>7.0f}")
+
+
+def print_report(reports: List[StepReport], min_fps_ratio: float, max_latency: float, streaming_only: bool):
+    """
+    print one row per ramp step and the largest client count that met the targets
+
+    :param reports: the first step has a single client, it is the baseline the other steps are judged against
+    :param min_fps_ratio: fraction of the baseline rate every client must receive
+    :param streaming_only: the source has no person, the numbers leave out pose landmark inference
+    """
+    # a single client gets every frame the pipeline publishes
+    video_rate = statistics.median(reports[0].video_fps)
+    landmark_rate = statistics.median(reports[0].landmark_fps) if len(reports[0].landmark_fps) > 0 else 0.0
+
+    print(f"{'clients':>7} {'video fps min/med':>18} {'video lat p50/p95':>18} "
+          f"{'3d fps min/med':>15} {'3d lat p50/p95':>16} {'cpu %':>7} {'rss MB':>7}")
+
+    capacity = 0
+    capacity_exceeded = False
+    for r in reports:
+        print(f"{r.num_clients:>7} "
+              f"{min(r.video_fps):>8.1f} /{statistics.median(r.video_fps):>8.1f} "
+              f"{_percentile(r.video_latencies, 0.5):>8.0f} /{_percentile(r.video_latencies, 0.95):>8.0f} "
+              f"{_format_landmark_columns(r)} "
+              f"{r.server_cpu:>7.0f} {r.server_rss:>7.0f}")
+
+        # capacity is the last step before the first one that misses the targets
+        if (min(r.video_fps) < min_fps_ratio * video_rate
+                or (len(r.landmark_fps) > 0 and min(r.landmark_fps) < min_fps_ratio * landmark_rate)
+                or _percentile(r.video_latencies, 0.95) > max_latency):
+            capacity_exceeded = True
+        elif not capacity_exceeded:
+            capacity = r.num_clients
+
+    target = f"every client >= {min_fps_ratio:.0%} of the 1 client rate, p95 latency <= {max_latency} ms"
+    if streaming_only:
+        print(f"\n1 client rate: {video_rate:.1f} video fps")
+        print(f"streaming capacity: {capacity} video clients ({target})")
+        print("the synthetic pattern has no person, mediapipe never runs its landmark model, so cpu is "
+              "under-reported, use a video with a person (e.g. dance.mp4) for hardware sizing")
+    else:
+        print(f"\n1 client rate: {video_rate:.1f} video fps, {landmark_rate:.1f} 3d fps")
+        print(f"capacity: {capacity} video + {capacity} 3d clients ({target})")
+
+
+async def main(args):
+    server_process = multiprocessing.get_context("spawn").Process(
+        target=run_server, args=(args.host, args.port, args.source, args.fps), daemon=True)
+    server_process.start()
+    server = psutil.Process(server_process.pid)
+    streaming_only = args.source == "synthetic"
+
+    try:
+        # wait for the server to accept requests
+        start_time = time.time()
+        while True:
+            try:
+                await http_request(args.host, args.port, "GET", "/health")
+                break
+            except OSError:
+                if time.time() - start_time > args.startup_timeout:
+                    raise TimeoutError("server did not start")
+                await asyncio.sleep(0.1)
+        print(f"server up in {time.time() - start_time:.2f} s")
+
+        await http_request(args.host, args.port, "POST", "/start-webcams",
+                           json.dumps(list(range(args.cameras))).encode())
+
+        # the first step is the 1 client baseline
+        ramp = args.ramp if args.ramp[0] == 1 else [1] + args.ramp
+
+        reports = []
+        for num_clients in ramp:
+            report = await run_step(args.host, args.port, num_clients, args.cameras, args.tier, server,
+                                    args.warmup, args.duration, streaming_only)
+            print(f"{num_clients} clients: video median {statistics.median(report.video_fps):.1f} fps, "
+                  f"server cpu {report.server_cpu:.0f} %")
+            reports.append(report)
+
+        print()
+        print_report(reports, args.min_fps_ratio, args.max_latency, streaming_only)
+
+        await http_request(args.host, args.port, "POST", "/stop-webcams")
+    finally:
+        server_process.terminate()
+        server_process.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="load test the streaming endpoints with simulated cameras")
+    parser.add_argument("--source", default="dance.mp4",
+                        help="video file with a person to play, or 'synthetic' to measure streaming only")
+    parser.add_argument("--cameras", type=int, default=2, help="number of simulated cameras")
+    parser.add_argument("--fps", type=float, default=30, help="frame rate of synthetic cameras")
+    parser.add_argument("--ramp", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32],
+                        help="number of concurrent clients of each kind per step, a 1 client step is added first")
+    parser.add_argument("--tier", default="high", help="preview tier requested by the video clients")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds before measuring each step")
+    parser.add_argument("--duration", type=float, default=10, help="seconds measured per step")
+    parser.add_argument("--min-fps-ratio", type=float, default=0.9,
+                        help="slowest acceptable client, as a fraction of the rate a single client receives")
+    parser.add_argument("--max-latency", type=float, default=500, help="p95 video latency budget (ms)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--startup-timeout", type=float, default=30)
+
+    asyncio.run(main(parser.parse_args()))
@@ -1,8 +1,12 @@
+import itertools
 import time
 from dataclasses import dataclass, field
 
 import numpy as np
 
+# process wide frame ids, used to follow a frame through the pipeline
+_frame_ids = itertools.count()
+
 
 @dataclass
 class FrameDto:
@@ -10,3 +14,4 @@ class FrameDto:
     device_index: int
     value: np.ndarray
     timestamp: int = field(default_factory=lambda: int(time.time() * 1000))  # (ms)
+    frame_id: int = field(default_factory=_frame_ids.__next__)
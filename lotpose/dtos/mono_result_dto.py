@@ -1,17 +1,21 @@
 from dataclasses import dataclass
+from typing import TYPE_CHECKING
 
 import numpy as np
-from mediapipe.tasks.python.vision import PoseLandmarkerResult
-import mediapipe as mp
+
+if TYPE_CHECKING:
+    # mediapipe is slow to import, only needed for type hints here
+    from mediapipe.tasks.python.vision import PoseLandmarkerResult
+    import mediapipe as mp
 
 
 @dataclass
 class MonoResultDto:
     """represents a result from a single camera"""
     device_index: int
-    result: PoseLandmarkerResult
-    input_img: mp.Image
+    result: "PoseLandmarkerResult"
+    input_img: "mp.Image"
     annotated_img: np.array  # BGR image
     timestamp: int
-
+    frame_id: int = -1  # id of the source frame
 
@@ -2,6 +2,7 @@ import time
 from typing import Protocol, List
 
 from lotpose.dtos.frame_dto import FrameDto
+from lotpose.tracing import tracer
 
 
 class FrameSource(Protocol):
@@ -51,6 +52,11 @@ class FrameCollector:
         if time.time() < self._obsolete_threshold_time:
             return self._current_frames
 
+        with tracer.span("frame_collector.get_frames"):
+            return self._collect_frames(frame_sources)
+
+    def _collect_frames(self, frame_sources: dict[int, FrameSource]) -> dict[int, FrameDto]:
+        """read new frames and renew the oldest until the batch is within the tolerant interval"""
         frames = {device_idx: frame_src.get_frame() for device_idx, frame_src in frame_sources.items()}
 
         if len(frames) == 1:
@@ -79,4 +85,5 @@ class FrameCollector:
 
             # renew the oldest frame
             oldest_frame = frames_sorted.pop(0)
-            frames_sorted.append(frame_sources[oldest_frame.device_index].get_frame())
+            with tracer.span("frame_collector.retry", oldest_frame.frame_id, oldest_frame.device_index):
+                frames_sorted.append(frame_sources[oldest_frame.device_index].get_frame())
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Callable, Optional, Any
+
+
+class FairInferenceScheduler:
+    """
+    Worker pool shared by every rig of the process.
+
+    Each owner (rig) has its own queue and idle workers take the next job of the owner that has received the least
+    worker time, so rigs share the cpu fairly whatever their number of cameras or model variant.
+    """
+
+    num_workers: int
+    busy_time: dict[str, float]  # (s) worker time spent on the jobs of each owner
+    _virtual_time: dict[str, float]  # (s) scheduling clock of each owner, busy time plus estimates of running jobs
+    _completed: dict[str, int]  # number of finished jobs of each owner
+    _running: dict[str, int]  # number of running jobs of each owner
+    _queues: dict[str, deque]  # owner -> pending (future, fn, args), ties are taken in this order
+    _condition: threading.Condition
+    _workers: list[threading.Thread]
+    _closed: bool
+
+    def __init__(self, num_workers: Optional[int] = None):
+        """
+        :param num_workers: number of worker threads, defaults to the number of cpus
+        """
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.busy_time = dict()
+        self._virtual_time = dict()
+        self._completed = dict()
+        self._running = dict()
+        self._queues = dict()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._workers = [threading.Thread(target=self._work, name=f"inference-{i}", daemon=True)
+                         for i in range(self.num_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, owner: str, fn: Callable, *args) -> Future:
+        """queue `fn(*args)` on behalf of `owner`"""
+        future = Future()
+        with self._condition:
+            assert not self._closed, "scheduler is shut down"
+
+            # an owner coming back from idle starts level with the active owners, idle time isn't credit
+            if owner not in self._queues and self._running.get(owner, 0) == 0:
+                active = [self._virtual_time[o] for o in self._virtual_time
+                          if o in self._queues or self._running.get(o, 0) > 0]
+                if len(active) > 0:
+                    self._virtual_time[owner] = max(self._virtual_time.get(owner, 0.0), min(active))
+
+            self._queues.setdefault(owner, deque()).append((future, fn, args))
+            self._condition.notify()
+        return future
+
+    async def run(self, owner: str, fn: Callable, *args) -> Any:
+        """run `fn(*args)` on the pool and wait for the result"""
+        return await asyncio.wrap_future(self.submit(owner, fn, *args))
+
+    def shutdown(self) -> None:
+        """stop the workers once the queued jobs are done"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        for worker in self._workers:
+            worker.join()
+
+    def _next_job(self) -> Optional[tuple[str, float, Future, Callable, tuple]]:
+        """take the oldest job of the owner with the least worker time, None when shut down"""
+        with self._condition:
+            while len(self._queues) == 0:
+                if self._closed:
+                    return None
+                self._condition.wait()
+
+            # the owner goes to the back of the line for ties, owners without pending jobs are dropped
+            owner = min(self._queues, key=lambda o: self._virtual_time.get(o, 0.0))
+            queue = self._queues.pop(owner)
+            future, fn, args = queue.popleft()
+            if len(queue) > 0:
+                self._queues[owner] = queue
+
+            # charge the expected cost up front so parallel workers don't all pick the same owner
+            estimate = self.busy_time.get(owner, 0.0) / max(self._completed.get(owner, 0), 1)
+            self._virtual_time[owner] = self._virtual_time.get(owner, 0.0) + estimate
+            self._running[owner] = self._running.get(owner, 0) + 1
+
+            return owner, estimate, future, fn, args
+
+    def _work(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            owner, estimate, future, fn, args = job
+
+            start_time = time.perf_counter()
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        result = fn(*args)
+                    except BaseException as e:
+                        future.set_exception(e)
+                    else:
+                        future.set_result(result)
+            finally:
+                elapsed = time.perf_counter() - start_time
+                # several workers finish jobs of the same owner concurrently
+                with self._condition:
+                    self.busy_time[owner] = self.busy_time.get(owner, 0.0) + elapsed
+                    self._virtual_time[owner] += elapsed - estimate
+                    self._completed[owner] = self._completed.get(owner, 0) + 1
+                    self._running[owner] -= 1
+
+
+@lru_cache(maxsize=None)
+def get_inference_scheduler(num_workers: Optional[int] = None) -> FairInferenceScheduler:
+    """process wide scheduler, workers are started on first use"""
+    return FairInferenceScheduler(num_workers)
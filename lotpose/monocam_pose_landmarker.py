@@ -1,68 +1,166 @@
 import asyncio
-from typing import List
+from functools import lru_cache
+from typing import Iterable, List, Optional, TYPE_CHECKING
 
 import cv2
 import numpy as np
-import mediapipe as mp
 from dotenv import dotenv_values
 
 from lotpose.dtos.frame_dto import FrameDto
 from lotpose.dtos.mono_result_dto import MonoResultDto
-from utils.mediapipe_utils import draw_landmarks_on_image
+from lotpose.inference_scheduler import FairInferenceScheduler
+from lotpose.motion_gate import MotionGate
+from lotpose.tracing import tracer
 
-BaseOptions = mp.tasks.BaseOptions
-PoseLandmarker = mp.tasks.vision.PoseLandmarker
-PoseLandmarkerOptions = mp.tasks.vision.PoseLandmarkerOptions
-PoseLandmarkerResult = mp.tasks.vision.PoseLandmarkerResult
-VisionRunningMode = mp.tasks.vision.RunningMode
+if TYPE_CHECKING:
+    import mediapipe as mp
+    from mediapipe.tasks.python.vision import PoseLandmarker, PoseLandmarkerResult
 
-env_vars = dotenv_values()
-pose_landmarker_path = env_vars['pose_landmarker_path']
+
+@lru_cache(maxsize=None)
+def get_pose_landmarker_path() -> str:
+    """read the model path from .env on first use instead of at import time"""
+    env_vars = dotenv_values()
+    return env_vars['pose_landmarker_path']
+
+
+def preload() -> None:
+    """import mediapipe and the drawing utils ahead of time, importing mediapipe takes seconds"""
+    import mediapipe  # noqa: F401
+    import utils.mediapipe_utils  # noqa: F401
 
 
 class MonoCamPoseLandmarker:
     """Single camera pose estimation"""
 
-    _landmarkers: dict[int, PoseLandmarker]  # list of landmarkers for each camera
+    _landmarkers: dict[int, "PoseLandmarker"]  # list of landmarkers for each camera
+    model_path: str
+    _pending_model_path: Optional[str]  # model to switch to before the next batch
 
     # _single_results
     _current_mono_results: dict[int, MonoResultDto]
+    motion_gate: Optional[MotionGate]  # skips inference for cameras whose scene didn't change
+    scheduler: Optional[FairInferenceScheduler]  # shared worker pool, None runs inference on the event loop
+    scheduler_owner: str  # the rig the inference jobs are scheduled for
 
-    def __init__(self, device_indices: List[int]):
+    def __init__(self, device_indices: List[int], motion_gate: Optional[MotionGate] = None,
+                 model_path: Optional[str] = None, scheduler: Optional[FairInferenceScheduler] = None,
+                 scheduler_owner: str = "default"):
         """
 
         :param num_cameras: the number of cameras input to the system
+        :param motion_gate: reuse the previous landmarks of static cameras, None runs inference on every frame
+        :param model_path: pose landmarker model, defaults to `pose_landmarker_path` in .env
+        :param scheduler: run the cameras in parallel on a shared worker pool
+        :param scheduler_owner: id the jobs are queued under, cpu is shared fairly between owners
         """
-        self._landmarkers = {
-            device_idx: PoseLandmarker.create_from_options(
-                PoseLandmarkerOptions(
-                    base_options=BaseOptions(model_asset_path=pose_landmarker_path),
-                    running_mode=VisionRunningMode.VIDEO)
-            )
-            for device_idx in device_indices
-        }
+        if model_path is None:
+            model_path = get_pose_landmarker_path()
+
+        self.model_path = model_path
+        self._pending_model_path = None
+        self._landmarkers = self._create_landmarkers(device_indices, model_path)
 
         self._current_mono_results = dict()
+        self.motion_gate = motion_gate
+        self.scheduler = scheduler
+        self.scheduler_owner = scheduler_owner
+
+    def switch_model(self, model_path: str) -> None:
+        """use another pose model from the next batch on, e.g. when the load of the shared workers changed"""
+        self._pending_model_path = model_path if model_path != self.model_path else None
 
     async def process_async(self, frames: dict[int, FrameDto]) -> dict[int, MonoResultDto]:
         """process a batch of frames
         :param frames:  for each camera
         :rtype: pose landmarks in shape (33, 3)
         """
+        if self._pending_model_path is not None:
+            await asyncio.to_thread(self._load_pending_model)
+
+        previous_results = self._current_mono_results
         self._current_mono_results = dict()
-        mp_images = {device_idx: (mp.Image(image_format=mp.ImageFormat.SRGB,
-                                           data=cv2.cvtColor(frame.value, cv2.COLOR_BGR2RGB)), frame.timestamp) for
-                     device_idx, frame in frames.items()}
 
         # process images
+        jobs = []
         for device_idx in self._landmarkers.keys():
-            img, ts = mp_images[device_idx]
-            result = self._landmarkers[device_idx].detect_for_video(img, ts)
-            annotated_img = cv2.cvtColor(draw_landmarks_on_image(img.numpy_view(), result), cv2.COLOR_RGB2BGR)
-            self._current_mono_results[device_idx] = MonoResultDto(device_idx, result, img, annotated_img, ts)
+            frame = frames[device_idx]
+            previous = previous_results.get(device_idx)
+
+            # nothing moved, skip inference and draw the previous landmarks on the current frame, so the preview
+            # stays live and the result carries the timestamp and frame id of the current frame
+            if (self.motion_gate is not None
+                    and not self.motion_gate.should_infer(device_idx, frame.value, frame.timestamp)
+                    and previous is not None):
+                jobs.append((self._annotate, device_idx, frame, previous.result))
+                continue
+
+            jobs.append((self._infer, device_idx, frame))
+
+        if self.scheduler is None:
+            results = [fn(*args) for fn, *args in jobs]
+        else:
+            # cameras run in parallel, each landmarker still gets one frame at a time
+            results = await asyncio.gather(*(self.scheduler.run(self.scheduler_owner, fn, *args)
+                                             for fn, *args in jobs))
+
+        for mono_result in results:
+            self._current_mono_results[mono_result.device_index] = mono_result
 
         return self._current_mono_results
 
+    @staticmethod
+    def _create_landmarkers(device_indices: Iterable[int], model_path: str) -> dict[int, "PoseLandmarker"]:
+        import mediapipe as mp
+
+        BaseOptions = mp.tasks.BaseOptions
+        PoseLandmarker = mp.tasks.vision.PoseLandmarker
+        PoseLandmarkerOptions = mp.tasks.vision.PoseLandmarkerOptions
+        VisionRunningMode = mp.tasks.vision.RunningMode
+
+        return {
+            device_idx: PoseLandmarker.create_from_options(
+                PoseLandmarkerOptions(
+                    base_options=BaseOptions(model_asset_path=model_path),
+                    running_mode=VisionRunningMode.VIDEO)
+            )
+            for device_idx in device_indices
+        }
+
+    def _load_pending_model(self) -> None:
+        """replace the landmarkers between two batches, no inference job of this camera set is running"""
+        model_path = self._pending_model_path
+        self._pending_model_path = None
+
+        old_landmarkers = self._landmarkers
+        self._landmarkers = self._create_landmarkers(old_landmarkers.keys(), model_path)
+        self.model_path = model_path
+        for landmarker in old_landmarkers.values():
+            landmarker.close()
+
+    def _infer(self, device_idx: int, frame: FrameDto) -> MonoResultDto:
+        """run pose inference on one frame and annotate it, thread safe across different devices"""
+        import mediapipe as mp
+
+        with tracer.span("mono.detect_for_video", frame.frame_id, device_idx):
+            img = mp.Image(image_format=mp.ImageFormat.SRGB, data=cv2.cvtColor(frame.value, cv2.COLOR_BGR2RGB))
+            result = self._landmarkers[device_idx].detect_for_video(img, frame.timestamp)
+        return self._annotate(device_idx, frame, result, img)
+
+    @staticmethod
+    def _annotate(device_idx: int, frame: FrameDto, result: "PoseLandmarkerResult",
+                  img: Optional["mp.Image"] = None) -> MonoResultDto:
+        """draw the landmarks of `result` on the frame, `img` is the frame in RGB if already converted"""
+        import mediapipe as mp
+        from utils.mediapipe_utils import draw_landmarks_on_image
+
+        with tracer.span("mono.annotate", frame.frame_id, device_idx):
+            if img is None:
+                img = mp.Image(image_format=mp.ImageFormat.SRGB,
+                               data=cv2.cvtColor(frame.value, cv2.COLOR_BGR2RGB))
+            annotated_img = cv2.cvtColor(draw_landmarks_on_image(img.numpy_view(), result), cv2.COLOR_RGB2BGR)
+        return MonoResultDto(device_idx, result, img, annotated_img, frame.timestamp, frame.frame_id)
+
 
 # if __name__ == '__main__':
 #     mono_landmarker = MonoCamPoseLandmarker()
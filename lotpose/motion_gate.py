@@ -0,0 +1,69 @@
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Cheap per camera change detector, decides whether a frame needs a new pose inference"""
+
+    pixel_threshold: int  # absolute difference [0, 255] above which a thumbnail pixel counts as changed
+    changed_fraction: float  # fraction of changed thumbnail pixels above which the scene counts as changed
+    refresh_interval: int  # (ms) force an inference at least this often
+    thumbnail_size: tuple[int, int]  # (width, height)
+    hits: int  # number of frames where the previous result was reused
+    misses: int  # number of frames that ran inference
+    _reference_thumbnails: dict[int, np.ndarray]  # thumbnail at the last inference, for each camera
+    _last_inference_time: dict[int, int]  # timestamp of the last inference, for each camera
+
+    def __init__(self, pixel_threshold: int = 25, changed_fraction: float = 0.02, refresh_interval: int = 1000,
+                 thumbnail_size=(32, 24)):
+        """
+        :param pixel_threshold: absolute difference of a grayscale thumbnail pixel that counts as changed
+        :param changed_fraction: fraction of changed pixels that counts as motion, a local change like a person
+            moving in a corner isn't averaged out by the static rest of the frame
+        :param refresh_interval: maximum time between two inferences of the same camera (ms)
+        :param thumbnail_size: size the frames are downscaled to before comparing
+        """
+        self.pixel_threshold = pixel_threshold
+        self.changed_fraction = changed_fraction
+        self.refresh_interval = refresh_interval
+        self.thumbnail_size = thumbnail_size
+        self.hits = 0
+        self.misses = 0
+        self._reference_thumbnails = dict()
+        self._last_inference_time = dict()
+
+    @property
+    def hit_rate(self) -> float:
+        """fraction of frames that skipped inference"""
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def should_infer(self, device_index: int, frame: np.ndarray, timestamp: int) -> bool:
+        """
+        compare the frame against the one of the last inference of the camera
+
+        we compare against the last inferred frame rather than the previous one, so slow drift still triggers
+        """
+        thumbnail = self._thumbnail(frame)
+        reference: Optional[np.ndarray] = self._reference_thumbnails.get(device_index)
+
+        is_static = (
+                reference is not None
+                and timestamp - self._last_inference_time[device_index] < self.refresh_interval
+                and (cv2.absdiff(thumbnail, reference) > self.pixel_threshold).mean() <= self.changed_fraction
+        )
+
+        if is_static:
+            self.hits += 1
+            return False
+
+        self.misses += 1
+        self._reference_thumbnails[device_index] = thumbnail
+        self._last_inference_time[device_index] = timestamp
+        return True
+
+    def _thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        small = cv2.resize(frame, self.thumbnail_size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
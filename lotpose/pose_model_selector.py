@@ -0,0 +1,219 @@
+import logging
+import math
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+from lotpose.monocam_pose_landmarker import get_pose_landmarker_path
+
+logger = logging.getLogger(__name__)
+
+# mediapipe pose model variants, from the least to the most accurate
+POSE_MODEL_VARIANTS = ("lite", "full", "heavy")
+
+# a frame with a person in it, the landmark model only runs once the detector finds someone
+SAMPLE_IMAGE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "saved_image.jpg")
+
+
+@dataclass
+class PoseModelBenchmark:
+    """measured inference latency of a model variant on this host"""
+    variant: str
+    model_path: str
+    latency: float  # (ms) mean per frame, with a single landmarker running
+
+
+def discover_pose_model_variants(model_path: str) -> dict[str, str]:
+    """
+    find the pose_landmarker_{lite,full,heavy}.task files next to the configured model
+
+    :return: variant name -> model path, ordered from the least to the most accurate
+    """
+    model_dir = os.path.dirname(model_path)
+    variants = {name: os.path.join(model_dir, f"pose_landmarker_{name}.task") for name in POSE_MODEL_VARIANTS}
+    variants = {name: path for name, path in variants.items() if os.path.exists(path)}
+
+    # the configured model doesn't follow the naming, use it alone
+    if len(variants) == 0:
+        variants = {os.path.splitext(os.path.basename(model_path))[0]: model_path}
+
+    return variants
+
+
+def load_sample_frames(image_path: str = SAMPLE_IMAGE_PATH, num_frames: int = 5) -> Optional[List[np.ndarray]]:
+    """frames to benchmark on (BGR), None if the sample image can't be read"""
+    img = cv2.imread(image_path) if os.path.exists(image_path) else None
+    if img is None:
+        return None
+    return [img] * num_frames
+
+
+class PoseModelSelector:
+    """Picks the most accurate pose model variant that fits the per frame latency budget"""
+
+    model_variants: dict[str, str]  # variant name -> model path, from the least to the most accurate
+    default_variant: str  # used when the benchmark can't tell the variants apart
+    frame_budget: float  # (ms) time available to run inference on one batch of all cameras
+    benchmarks: dict[str, PoseModelBenchmark]
+    _parallel_latencies: dict[int, dict[str, float]]  # landmarkers running at once -> variant -> (ms) per frame
+    _sample_frames: Optional[List[np.ndarray]]
+    _benchmarked: bool
+    _lock: threading.Lock
+
+    def __init__(self, model_variants: dict[str, str], frame_budget: float = 33,
+                 default_variant: Optional[str] = None):
+        """
+        :param model_variants: variant name -> model path, from the least to the most accurate
+        :param default_variant: the configured model, defaults to the least accurate variant
+        :param frame_budget: time for one batch of all cameras (ms), the cameras run in parallel on the shared
+            inference workers
+        """
+        self.model_variants = model_variants
+        self.default_variant = default_variant if default_variant is not None else next(iter(model_variants))
+        self.frame_budget = frame_budget
+        self.benchmarks = dict()
+        self._parallel_latencies = dict()
+        self._sample_frames = None
+        self._benchmarked = False
+        self._lock = threading.Lock()
+
+    def benchmark(self, sample_frames: Optional[List[np.ndarray]] = None) -> dict[str, PoseModelBenchmark]:
+        """
+        measure every variant once per process, blocking, concurrent callers wait for the same run
+
+        empty when there is nothing to choose from or the sample frames don't show a person
+        """
+        with self._lock:
+            if self._benchmarked:
+                return self.benchmarks
+            self._benchmarked = True
+
+            # nothing to choose from
+            if len(self.model_variants) == 1:
+                return self.benchmarks
+
+            if sample_frames is None:
+                sample_frames = load_sample_frames()
+            if sample_frames is None:
+                logger.warning("no sample image at %s, using the %s pose model", SAMPLE_IMAGE_PATH,
+                               self.default_variant)
+                return self.benchmarks
+
+            benchmarks = dict()
+            for variant, model_path in self.model_variants.items():
+                latency = self._measure_latency(model_path, sample_frames, 1)
+                if latency is None:
+                    # without a person only the detector runs, every variant would measure the same
+                    logger.warning("no pose found in the sample frames, using the %s pose model",
+                                   self.default_variant)
+                    return self.benchmarks
+                benchmarks[variant] = PoseModelBenchmark(variant, model_path, latency)
+
+            self.benchmarks = benchmarks
+            self._sample_frames = sample_frames
+            self._parallel_latencies[1] = {v: b.latency for v, b in benchmarks.items()}
+            return self.benchmarks
+
+    def parallel_latencies(self, parallel: int) -> dict[str, float]:
+        """
+        per frame latency of every variant with `parallel` landmarkers running at once, measured once per count
+
+        the landmarkers compete for the cores and memory bandwidth, so it grows with `parallel` even when there
+        are enough cores
+
+        :return: variant name -> latency (ms), empty if the benchmark couldn't tell the variants apart
+        """
+        if len(self.benchmark()) == 0:
+            return dict()
+
+        with self._lock:
+            if parallel not in self._parallel_latencies:
+                latencies = dict()
+                for variant, model_path in self.model_variants.items():
+                    latency = self._measure_latency(model_path, self._sample_frames, parallel)
+                    # the sample frames showed a person to the single landmarker, keep its time if not this time
+                    latencies[variant] = latency if latency is not None else self.benchmarks[variant].latency
+                self._parallel_latencies[parallel] = latencies
+            return self._parallel_latencies[parallel]
+
+    def select(self, num_cameras: int, num_workers: int = 1) -> str:
+        """
+        choose a variant for the given load, blocking, benchmarks first with as many landmarkers running at once
+        as the load has if that count hasn't been measured yet
+
+        :param num_cameras: cameras sharing the inference workers, including the ones of other rigs
+        :param num_workers: inference worker threads
+        :return: the variant name
+        """
+        # up to one landmarker per worker runs at once, each worker runs ceil(cameras / workers) of them per batch
+        num_cameras = max(num_cameras, 1)
+        num_workers = max(num_workers, 1)
+        latencies = self.parallel_latencies(min(num_cameras, num_workers))
+        if len(latencies) == 0:
+            return self.default_variant
+
+        rounds = math.ceil(num_cameras / num_workers)
+        per_frame_budget = self.frame_budget / rounds
+        fitting = [v for v in self.model_variants if latencies[v] <= per_frame_budget]
+        if len(fitting) > 0:
+            return fitting[-1]
+
+        # nothing fits, fall back to the fastest one
+        return min(latencies, key=latencies.get)
+
+    @staticmethod
+    def _measure_latency(model_path: str, sample_frames: List[np.ndarray], parallel: int) -> Optional[float]:
+        """
+        mean detect_for_video time (ms) with `parallel` landmarkers each running the frames in their own thread,
+        the first frame is a warm-up and isn't counted
+
+        None if no pose is found, the time would only be the detector's
+        """
+        import mediapipe as mp
+
+        landmarkers = [
+            mp.tasks.vision.PoseLandmarker.create_from_options(
+                mp.tasks.vision.PoseLandmarkerOptions(
+                    base_options=mp.tasks.BaseOptions(model_asset_path=model_path),
+                    running_mode=mp.tasks.vision.RunningMode.VIDEO)
+            )
+            for _ in range(parallel)
+        ]
+        images = [mp.Image(image_format=mp.ImageFormat.SRGB, data=cv2.cvtColor(f, cv2.COLOR_BGR2RGB))
+                  for f in sample_frames]
+
+        def run(landmarker) -> float:
+            """time of the frames after the warm-up (s)"""
+            with landmarker:
+                if len(landmarker.detect_for_video(images[0], 0).pose_landmarks) == 0:
+                    return math.nan
+
+                start_time = time.perf_counter()
+                for i, img in enumerate(images[1:], start=1):
+                    landmarker.detect_for_video(img, i * 33)
+                return time.perf_counter() - start_time
+
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            elapsed = list(executor.map(run, landmarkers))
+
+        if any(math.isnan(e) for e in elapsed):
+            return None
+        return statistics.mean(elapsed) * 1000 / max(len(images) - 1, 1)
+
+
+@lru_cache(maxsize=None)
+def get_pose_model_selector(frame_budget: float = 33) -> PoseModelSelector:
+    """process wide selector, variants are discovered on first use"""
+    model_path = get_pose_landmarker_path()
+    model_variants = discover_pose_model_variants(model_path)
+    default_variant = next((v for v, p in model_variants.items()
+                            if os.path.abspath(p) == os.path.abspath(model_path)), None)
+    return PoseModelSelector(model_variants, frame_budget, default_variant)
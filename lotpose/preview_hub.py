@@ -0,0 +1,175 @@
+import asyncio
+from dataclasses import dataclass
+from enum import Enum
+from typing import List, Optional
+
+import cv2
+
+from lotpose.dtos.mono_result_dto import MonoResultDto
+from lotpose.tracing import tracer
+
+
+class PreviewTierName(str, Enum):
+    """name of a preview tier, selected by the client"""
+    low = "low"
+    medium = "medium"
+    high = "high"
+
+
+@dataclass(frozen=True)
+class PreviewTier:
+    """resolution and jpeg quality of a preview stream"""
+    name: PreviewTierName
+    width: Optional[int]  # output width (px), None keeps the source resolution
+    jpeg_quality: int  # [0, 100]
+
+
+PREVIEW_TIERS: dict[PreviewTierName, PreviewTier] = {
+    PreviewTierName.low: PreviewTier(PreviewTierName.low, 320, 50),
+    PreviewTierName.medium: PreviewTier(PreviewTierName.medium, 640, 70),
+    PreviewTierName.high: PreviewTier(PreviewTierName.high, None, 90),
+}
+
+
+@dataclass(frozen=True)
+class PreviewFrame:
+    """an encoded preview frame"""
+    timestamp: int  # (ms) capture time of the source frame
+    jpeg: bytes
+
+
+class LatestFrameOutbox:
+    """per connection outbox that only keeps the latest frame, older unsent frames are dropped"""
+
+    dropped: int  # number of frames dropped because the consumer was too slow
+    _item: Optional[PreviewFrame]
+    _closed: bool
+    _event: asyncio.Event
+
+    def __init__(self):
+        self.dropped = 0
+        self._item = None
+        self._closed = False
+        self._event = asyncio.Event()
+
+    def put(self, item: PreviewFrame) -> None:
+        """replace the pending frame, never blocks"""
+        if self._item is not None:
+            self.dropped += 1
+        self._item = item
+        self._event.set()
+
+    def close(self) -> None:
+        """wake up the consumer, `get` returns None afterwards"""
+        self._closed = True
+        self._event.set()
+
+    async def get(self) -> Optional[PreviewFrame]:
+        """wait for the next frame, return None if the outbox is closed"""
+        await self._event.wait()
+        self._event.clear()
+        if self._closed:
+            return None
+        item, self._item = self._item, None
+        return item
+
+
+class PreviewHub:
+    """Encodes annotated frames once per (device, tier) and fans them out to the subscribed outboxes"""
+
+    _subscribers: dict[tuple[int, PreviewTierName], set[LatestFrameOutbox]]
+    _encoded: dict[tuple[int, PreviewTierName], PreviewFrame]
+    _closed_dropped: int  # frames dropped by the outboxes of closed connections
+
+    def __init__(self):
+        self._subscribers = dict()
+        self._encoded = dict()
+        self._closed_dropped = 0
+
+    @property
+    def dropped(self) -> int:
+        """number of frames dropped for slow clients, over open and closed connections"""
+        return self._closed_dropped + sum(o.dropped for outboxes in self._subscribers.values() for o in outboxes)
+
+    def subscribe(self, device_index: int, tier_name: PreviewTierName) -> LatestFrameOutbox:
+        """create an outbox for a new connection"""
+        outbox = LatestFrameOutbox()
+        key = (device_index, tier_name)
+        self._subscribers.setdefault(key, set()).add(outbox)
+
+        # send the last encoded frame right away so new clients don't wait for the next batch
+        if key in self._encoded:
+            outbox.put(self._encoded[key])
+
+        return outbox
+
+    def unsubscribe(self, device_index: int, tier_name: PreviewTierName, outbox: LatestFrameOutbox) -> None:
+        """remove the outbox of a closed connection"""
+        key = (device_index, tier_name)
+        outboxes = self._subscribers.get(key)
+        if outboxes is None:
+            return
+        if outbox in outboxes:
+            outboxes.discard(outbox)
+            self._closed_dropped += outbox.dropped
+        if len(outboxes) == 0:
+            del self._subscribers[key]
+            self._encoded.pop(key, None)
+
+    async def publish(self, mono_results: dict[int, MonoResultDto]) -> None:
+        """encode the annotated images for every watched tier in a worker thread and push them to the subscribers"""
+        to_encode = []
+        for key in self._subscribers:
+            mono_result = mono_results.get(key[0])
+            if mono_result is None:
+                continue
+
+            cached = self._encoded.get(key)
+            if cached is not None and cached.timestamp == mono_result.timestamp:
+                continue
+
+            to_encode.append((key, mono_result))
+
+        if len(to_encode) == 0:
+            return
+
+        # resizing and encoding blocks, keep the event loop free for the other rigs and the streams
+        preview_frames = await asyncio.to_thread(self._encode_all, to_encode)
+
+        for (key, _), preview_frame in zip(to_encode, preview_frames):
+            # the last client left or the hub was closed while encoding
+            outboxes = self._subscribers.get(key)
+            if outboxes is None:
+                continue
+
+            self._encoded[key] = preview_frame
+            for outbox in outboxes:
+                outbox.put(preview_frame)
+
+    def close(self) -> None:
+        """close all outboxes, used when the webcams are stopped"""
+        for outboxes in self._subscribers.values():
+            for outbox in outboxes:
+                outbox.close()
+                self._closed_dropped += outbox.dropped
+        self._subscribers = dict()
+        self._encoded = dict()
+
+    def _encode_all(self, to_encode: List[tuple[tuple[int, PreviewTierName], MonoResultDto]]) -> List[PreviewFrame]:
+        """encode the annotated image of each (key, mono result), blocking"""
+        preview_frames = []
+        for (device_index, tier_name), mono_result in to_encode:
+            with tracer.span("preview.encode", mono_result.frame_id, device_index):
+                preview_frames.append(PreviewFrame(mono_result.timestamp,
+                                                   self._encode(mono_result.annotated_img, PREVIEW_TIERS[tier_name])))
+        return preview_frames
+
+    @staticmethod
+    def _encode(img, tier: PreviewTier) -> bytes:
+        """resize and encode to jpeg"""
+        if tier.width is not None and img.shape[1] > tier.width:
+            height = round(img.shape[0] * tier.width / img.shape[1])
+            img = cv2.resize(img, (tier.width, height), interpolation=cv2.INTER_AREA)
+
+        _, jpeg = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, tier.jpeg_quality])
+        return jpeg.tobytes()
@@ -0,0 +1,106 @@
+import time
+from typing import Tuple
+
+import cv2
+import numpy as np
+
+from lotpose.dtos.frame_dto import FrameDto
+from lotpose.webcam_controller import WebcamController
+
+
+class SyntheticFrameSource(WebcamController):
+    """stand-in for a webcam that renders a moving test pattern, for running the server without cameras"""
+    fps: float
+    _next_frame_time: float
+    _frame_count: int
+
+    def __init__(self, device_index: int, request_width: int, request_height: int, fps: float = 30):
+        """
+        :param fps: frame rate to emulate, `get_frame` blocks like a real webcam read
+        """
+        self.fps = fps
+        self._next_frame_time = 0
+        self._frame_count = 0
+        super().__init__(device_index, request_width, request_height)
+
+    def start(self):
+        self._next_frame_time = time.time()
+
+    def stop(self):
+        pass
+
+    def _read_frame(self) -> FrameDto:
+        _wait_until(self._next_frame_time)
+        self._next_frame_time = max(self._next_frame_time + 1 / self.fps, time.time())
+
+        # gradient background with a square bouncing horizontally, so consecutive frames differ
+        frame = np.zeros((self.height, self.width, 3), np.uint8)
+        frame[:, :, 0] = np.linspace(0, 255, self.width, dtype=np.uint8)
+        frame[:, :, 1] = (self.device_index * 60) % 256
+        size = self.height // 4
+        x = int((self.width - size) * (0.5 + 0.5 * np.sin(self._frame_count / self.fps)))
+        cv2.rectangle(frame, (x, self.height // 2 - size // 2), (x + size, self.height // 2 + size // 2),
+                      (255, 255, 255), -1)
+        cv2.putText(frame, f"cam {self.device_index} #{self._frame_count}", (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+        self._frame_count += 1
+
+        return FrameDto(self.device_index, frame)
+
+    def _get_width_height(self, request_width: int, request_height: int) -> Tuple[int, int]:
+        return request_width, request_height
+
+
+class VideoFileFrameSource(WebcamController):
+    """stand-in for a webcam that plays a video file in a loop, paced at the video's frame rate"""
+    video_path: str
+    fps: float
+    _next_frame_time: float
+
+    def __init__(self, device_index: int, request_width: int, request_height: int, video_path: str):
+        """
+        :param video_path: the video to play, every camera plays it from a different offset
+        """
+        self.video_path = video_path
+        self._next_frame_time = 0
+        super().__init__(device_index, request_width, request_height)
+
+    def start(self):
+        self._capture = cv2.VideoCapture(self.video_path)
+        self.fps = self._capture.get(cv2.CAP_PROP_FPS) or 30
+
+        # offset cameras by one second each so they don't show the same frame
+        frame_count = int(self._capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        if frame_count > 0:
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, int(self.device_index * self.fps) % frame_count)
+
+        self._next_frame_time = time.time()
+
+    def _read_frame(self) -> FrameDto:
+        _wait_until(self._next_frame_time)
+        self._next_frame_time = max(self._next_frame_time + 1 / self.fps, time.time())
+
+        ok, frame = self._capture.read()
+        if not ok:
+            # rewind at the end of the video
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            _, frame = self._capture.read()
+
+        if frame.shape[1] != self.width or frame.shape[0] != self.height:
+            frame = cv2.resize(frame, (self.width, self.height))
+
+        return FrameDto(self.device_index, frame)
+
+    def _get_width_height(self, request_width: int, request_height: int) -> Tuple[int, int]:
+        # keep the requested width, follow the video's aspect ratio
+        capture = cv2.VideoCapture(self.video_path)
+        _, frame = capture.read()
+        capture.release()
+        return request_width, round(frame.shape[0] * request_width / frame.shape[1])
+
+
+def _wait_until(t: float) -> None:
+    """block like a webcam waiting for its next frame"""
+    delay = t - time.time()
+    if delay > 0:
+        time.sleep(delay)
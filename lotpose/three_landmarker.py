@@ -4,6 +4,7 @@ import numpy as np
 
 from lotpose.dtos.landmark_3d_dto import Landmark3dDto
 from lotpose.dtos.mono_result_dto import MonoResultDto
+from lotpose.tracing import tracer
 
 
 class ThreeLandmarker:
@@ -12,7 +13,13 @@ class ThreeLandmarker:
     def process(self, mono_results: dict[int, MonoResultDto]) -> Optional[Landmark3dDto]:
         """process mono results and return 3d landmark"""
 
-        target = mono_results[0]
+        # the lowest device index of the rig is the reference camera, rigs don't necessarily own device 0
+        target = mono_results[min(mono_results)]
+
+        with tracer.span("three_landmarker.process", target.frame_id, target.device_index):
+            return self._process(target)
+
+    def _process(self, target: MonoResultDto) -> Optional[Landmark3dDto]:
         mono_landmark = target.result.pose_landmarks
         if mono_landmark is None or mono_landmark == []:
             return None
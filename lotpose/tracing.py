@@ -0,0 +1,143 @@
+"""
+Opt-in per frame tracing.
+
+Spans are tagged with the frame id and device and kept in a fixed size ring buffer, they can be exported as
+Chrome trace JSON and opened in chrome://tracing or https://ui.perfetto.dev. Tracing is off by default, set
+LOTPOSE_TRACE=1 or call `tracer.enable()`. When off, `tracer.span` returns a shared no-op context manager.
+
+    python -m lotpose.tracing --url http://localhost:8000/trace -o trace.json
+"""
+import itertools
+import os
+import threading
+import time
+from typing import Optional
+
+
+class _NoopSpan:
+    """returned when tracing is off, does nothing"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+    def set_frame_id(self, frame_id: int) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    """times a block and records it in the tracer's ring buffer on exit"""
+    __slots__ = ("_tracer", "_name", "_frame_id", "_device", "_start")
+
+    def __init__(self, tracer: "Tracer", name: str, frame_id: Optional[int], device: Optional[int]):
+        self._tracer = tracer
+        self._name = name
+        self._frame_id = frame_id
+        self._device = device
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._tracer.record(self._name, self._start, time.perf_counter_ns() - self._start, self._frame_id,
+                            self._device)
+        return False
+
+    def set_frame_id(self, frame_id: int) -> None:
+        """tag the span with a frame id that is only known inside the block"""
+        self._frame_id = frame_id
+
+
+class Tracer:
+    """Records spans in a lock free ring buffer, the oldest spans are overwritten when it is full"""
+
+    enabled: bool
+    capacity: int
+    _buffer: list  # (sequence, name, start (ns), duration (ns), thread id, frame id, device)
+    _sequence: itertools.count
+
+    def __init__(self, capacity: int = 65536, enabled: bool = False):
+        """
+        :param capacity: number of spans kept
+        :param enabled: record spans from the start
+        """
+        self.enabled = enabled
+        self.capacity = capacity
+        self.clear()
+
+    def span(self, name: str, frame_id: Optional[int] = None, device: Optional[int] = None):
+        """context manager timing a block, tagged with the frame id and device it works on"""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, name, frame_id, device)
+
+    def record(self, name: str, start: int, duration: int, frame_id: Optional[int] = None,
+               device: Optional[int] = None) -> None:
+        """
+        add a finished span, `start` and `duration` in ns (perf_counter_ns)
+
+        next() on itertools.count and a list item assignment are atomic under the GIL, so no lock is needed
+        """
+        sequence = next(self._sequence)
+        self._buffer[sequence % self.capacity] = (sequence, name, start, duration, threading.get_ident(),
+                                                  frame_id, device)
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def clear(self) -> None:
+        self._buffer = [None] * self.capacity
+        self._sequence = itertools.count()
+
+    def to_chrome_trace(self) -> dict:
+        """the recorded spans in the Chrome trace event format, oldest first"""
+        spans = sorted((s for s in list(self._buffer) if s is not None), key=lambda s: s[0])
+        pid = os.getpid()
+
+        events = []
+        for _, name, start, duration, tid, frame_id, device in spans:
+            args = dict()
+            if frame_id is not None:
+                args["frame_id"] = frame_id
+            if device is not None:
+                args["device"] = device
+            events.append({"name": name, "ph": "X", "ts": start / 1000, "dur": duration / 1000,
+                           "pid": pid, "tid": tid, "args": args})
+
+        # name the thread lanes
+        thread_names = {t.ident: t.name for t in threading.enumerate()}
+        for tid in {s[4] for s in spans}:
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                           "args": {"name": thread_names.get(tid, str(tid))}})
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+# process wide tracer
+tracer = Tracer(enabled=os.environ.get("LOTPOSE_TRACE", "0") == "1")
+
+
+if __name__ == "__main__":
+    import argparse
+    import urllib.request
+
+    parser = argparse.ArgumentParser(description="download the recorded spans of a running server")
+    parser.add_argument("--url", default="http://localhost:8000/trace")
+    parser.add_argument("-o", "--output", default="trace.json")
+    args = parser.parse_args()
+
+    with urllib.request.urlopen(args.url) as response, open(args.output, "wb") as f:
+        f.write(response.read())
+
+    print(f"saved to {args.output}, open it in chrome://tracing or https://ui.perfetto.dev")
@@ -4,6 +4,7 @@ import cv2
 import numpy as np
 
 from lotpose.dtos.frame_dto import FrameDto
+from lotpose.tracing import tracer
 
 
 class WebcamController:
@@ -40,6 +41,15 @@ class WebcamController:
     def get_frame(self) -> FrameDto:
         """get a frame from the queue"""
 
+        with tracer.span("webcam.get_frame", device=self.device_index) as span:
+            frame_dto = self._read_frame()
+            span.set_frame_id(frame_dto.frame_id)
+
+        return frame_dto
+
+    def _read_frame(self) -> FrameDto:
+        """read the next frame from the webcam, blocks until it is available"""
+
         # Capture frame-by-frame
         _, frame = self._capture.read()
 
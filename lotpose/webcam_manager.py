@@ -1,4 +1,5 @@
-from typing import List
+import threading
+from typing import List, Callable
 
 import numpy as np
 
@@ -11,18 +12,26 @@ class WebcamManager:
     _webcam_controllers: dict[int, WebcamController]
     _frame_collector: FrameCollector
     _webcam_pair_RT: dict[tuple[int, int], tuple[np.array, np.array]]
+    _frames_lock: threading.Lock  # the pipeline and the calibration read frames from worker threads
 
     def __init__(self, device_indices: List[int], frame_collector: FrameCollector,
                  request_width: int,
-                 request_height: int):
+                 request_height: int,
+                 controller_factory: Callable[[int, int, int], WebcamController] = WebcamController):
+        """
+        :param controller_factory: makes the controller of a device from (device_index, request_width, request_height),
+            lets synthetic frame sources stand in for webcams
+        """
 
         # make controllers
-        self._webcam_controllers = {idx: WebcamController(idx, request_width, request_height) for idx in device_indices}
+        self._webcam_controllers = {idx: controller_factory(idx, request_width, request_height) for idx in device_indices}
 
         self._frame_collector = frame_collector
 
         self._webcam_pair_RT = dict()
 
+        self._frames_lock = threading.Lock()
+
     def start_all(self):
         """start all webcams"""
         for webcam_ctr in self._webcam_controllers.values():
@@ -30,12 +39,15 @@ class WebcamManager:
 
     def stop_all(self):
         """stop all webcams"""
-        for webcam_ctr in self._webcam_controllers.values():
-            webcam_ctr.stop()
+        # wait for an in-flight read to finish before releasing the captures
+        with self._frames_lock:
+            for webcam_ctr in self._webcam_controllers.values():
+                webcam_ctr.stop()
 
     def get_frames(self) -> dict[int, FrameDto]:
         """get batch of frames from each source"""
-        batch_frames = self._frame_collector.get_frames(self._webcam_controllers)
+        with self._frames_lock:
+            batch_frames = self._frame_collector.get_frames(self._webcam_controllers)
         return batch_frames
 
     def __getitem__(self, index: int):
@@ -1,8 +1,21 @@
-from typing import List
+from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, constr
 
 
 class MsgResponse(BaseModel):
     msg: str
 
+
+class HealthResponse(BaseModel):
+    status: str
+    is_warmed_up: bool
+    warmup_error: Optional[str] = None
+
+
+# used as a path segment of the rig's routes
+RigId = constr(regex=r"^[\w-]+$")
+
+
+class CreateRigRequest(BaseModel):
+    rig_id: RigId
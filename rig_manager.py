@@ -0,0 +1,83 @@
+from dataclasses import dataclass
+from typing import List, Optional
+
+import app_manager
+from app_manager import AppManager, IAppManager, DEFAULT_RIG_ID
+from lotpose.inference_scheduler import get_inference_scheduler
+
+
+@dataclass
+class RigInfo:
+    rig_id: str
+    webcam_stared: bool
+    stared_device_indices: List[int]
+    inference_time: float  # (s) worker time spent on the rig's inference, shows how cpu is shared
+
+
+class RigManager:
+    """Singleton class owning the camera rigs of the process, each rig is an AppManager with its own pipeline"""
+    Singleton: "RigManager" = None
+    _rigs: dict[str, IAppManager]
+
+    def __init__(self):
+        # the default rig backs the original un-prefixed routes
+        self._rigs = {DEFAULT_RIG_ID: AppManager.Singleton}
+
+    def create_rig(self, rig_id: str) -> IAppManager:
+        """create an idle rig"""
+        assert rig_id not in self._rigs, f"Rig {rig_id} already exists"
+
+        rig = AppManager(rig_id)
+        self._rigs[rig_id] = rig
+        return rig
+
+    def get_rig(self, rig_id: str) -> Optional[IAppManager]:
+        return self._rigs.get(rig_id)
+
+    async def remove_rig(self, rig_id: str) -> None:
+        """stop and remove a rig"""
+        assert rig_id != DEFAULT_RIG_ID, "The default rig can't be removed"
+        # the start would finish on a rig nobody can stop
+        assert not self._rigs[rig_id].get_app_state_dto().webcam_starting, f"Rig {rig_id} is starting"
+
+        rig = self._rigs.pop(rig_id)
+        if rig.get_app_state_dto().webcam_stared:
+            await rig.stop_webcams_n_pipeline()
+
+    def list_rigs(self) -> List[RigInfo]:
+        busy_time = get_inference_scheduler(app_manager.inference_workers).busy_time
+        infos = []
+        for rig_id, rig in self._rigs.items():
+            state = rig.get_app_state_dto()
+            infos.append(RigInfo(rig_id, state.webcam_stared, state.stared_device_indices,
+                                 busy_time.get(rig_id, 0.0)))
+        return infos
+
+    def count_cameras(self, exclude_rig_id: Optional[str] = None) -> int:
+        """number of cameras started (or starting) across the rigs, they share the inference workers"""
+        return sum(len(rig.get_app_state_dto().stared_device_indices) for rig_id, rig in self._rigs.items()
+                   if rig_id != exclude_rig_id)
+
+    def assert_devices_available(self, rig_id: str, device_indices: List[int]) -> None:
+        """a webcam can only be opened by one rig"""
+        for other_id, other in self._rigs.items():
+            if other_id == rig_id:
+                continue
+            in_use = set(device_indices) & set(other.get_app_state_dto().stared_device_indices)
+            assert len(in_use) == 0, f"Webcams {sorted(in_use)} already used by rig {other_id}"
+
+    async def reselect_pose_models(self) -> None:
+        """pick the pose model of every running rig again, after the total number of cameras changed"""
+        num_cameras = self.count_cameras()
+        for rig in list(self._rigs.values()):
+            if rig.get_app_state_dto().webcam_stared:
+                await rig.reselect_pose_model(num_cameras)
+
+    async def stop_all(self) -> None:
+        """stop the webcams and pipeline of every rig"""
+        for rig in self._rigs.values():
+            if rig.get_app_state_dto().webcam_stared:
+                await rig.stop_webcams_n_pipeline()
+
+
+RigManager.Singleton = RigManager()
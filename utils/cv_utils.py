@@ -1,4 +1,5 @@
-from typing import List
+import threading
+from typing import List, Optional
 from dataclasses import dataclass
 import cv2
 
@@ -38,6 +39,24 @@ def list_webcams() -> List[WebcamDeviceInfo]:
     return devices
 
 
+_webcams_info: Optional[List[WebcamDeviceInfo]] = None
+_webcams_info_lock = threading.Lock()
+
+
+def get_webcams_info(refresh: bool = False) -> List[WebcamDeviceInfo]:
+    """
+    Cached version of `list_webcams`, the webcams are only probed on first call or when `refresh` is set.
+
+    Probing opens every camera and takes a while, concurrent callers wait for the same probe.
+    """
+    global _webcams_info
+
+    with _webcams_info_lock:
+        if _webcams_info is None or refresh:
+            _webcams_info = list_webcams()
+        return _webcams_info
+
+
 if __name__ == "__main__":
 
     # Call the function to list all webcams
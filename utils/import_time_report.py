@@ -0,0 +1,52 @@
+import argparse
+import subprocess
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List
+
+
+@dataclass
+class ImportTime:
+    module: str
+    self_us: int
+    cumulative_us: int
+
+
+def measure_import_times(module: str) -> List[ImportTime]:
+    """
+    Imports a module in a fresh interpreter with `-X importtime` and parses the report.
+
+    Returns:
+        A list of ImportTime objects, one per imported module, in import order.
+    """
+    repo_root = Path(__file__).resolve().parent.parent
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               cwd=repo_root, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{completed.stderr}")
+
+    import_times = []
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        import_times.append(ImportTime(name.strip(), int(self_us), int(cumulative_us)))
+
+    return import_times
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="report the slowest imports of a module")
+    parser.add_argument("module", nargs="?", default="api_server")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    times = measure_import_times(args.module)
+    total_us = sum(t.self_us for t in times)
+
+    print(f"import {args.module}: {total_us / 1000:.1f} ms total, {len(times)} modules")
+    print(f"{'cumulative (ms)':>16} {'self (ms)':>10}  module")
+    for t in sorted(times, key=lambda t: t.cumulative_us, reverse=True)[:args.top]:
+        print(f"{t.cumulative_us / 1000:>16.1f} {t.self_us / 1000:>10.1f}  {t.module}")